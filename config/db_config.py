@@ -12,3 +12,6 @@ DB_CONFIG = {
     "port": int(os.getenv("DB_PORT", 5432))  # default 5432 if not set
 }
 
+# Size of the shared psycopg2 connection pool
+DB_POOL_MINCONN = int(os.getenv("DB_POOL_MINCONN", 1))
+DB_POOL_MAXCONN = int(os.getenv("DB_POOL_MAXCONN", 10))
@@ -1,9 +1,12 @@
 # db_connection.py
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from config.db_config import DB_CONFIG
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
+from config.db_config import DB_CONFIG, DB_POOL_MINCONN, DB_POOL_MAXCONN
 
 # Psycopg2 raw connection
 def get_connection():
@@ -14,13 +17,49 @@ def get_connection():
         print("Error connecting to database:", e)
         return None
 
+# Psycopg2 connection pool, shared by all threads of the process
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(DB_POOL_MINCONN, DB_POOL_MAXCONN, **DB_CONFIG)
+    return _pool
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the pool and give it back when done.
+    Yields None if the database is unreachable, like get_connection()."""
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except Exception as e:
+        print("Error connecting to database:", e)
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
 # SQLAlchemy ORM setup
 DATABASE_URL = (
     f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
     f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
 )
 
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+    pool_timeout=30,
+    pool_pre_ping=True,   # drop connections Postgres closed while idle
+    pool_recycle=1800
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -1,8 +1,26 @@
 # serp_db.py
-from db.db_connection import get_connection
+import csv
+import io
+from contextlib import contextmanager
+from psycopg2.extras import execute_values
+from db.db_connection import pooled_connection
 
-def init_db():
-    """Optional: create table if it doesn't exist."""
+@contextmanager
+def _use_connection(conn=None):
+    """Use the caller's connection if given, otherwise borrow one from the pool."""
+    if conn is not None:
+        yield conn
+    else:
+        with pooled_connection() as pooled:
+            yield pooled
+
+_initialized = False
+
+def init_db(conn=None):
+    """Optional: create table if it doesn't exist. Runs the DDL once per process."""
+    global _initialized
+    if _initialized:
+        return
     query = """
     CREATE TABLE IF NOT EXISTS url_collection (
         id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -13,50 +31,144 @@ def init_db():
         created_at TIMESTAMP DEFAULT NOW()
     )
     """
-    conn = get_connection()
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(query)
-            conn.commit()
-        conn.close()
+    # Staging table for batch insert mode; UNLOGGED skips WAL, its rows are transient anyway
+    stage_query = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS url_collection_stage (LIKE url_collection INCLUDING DEFAULTS)
+    """
+    with _use_connection(conn) as conn:
+        if conn:
+            with conn.cursor() as cur:
+                # Serialize concurrent crawler processes; released on commit
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('url_collection_init'))")
+                cur.execute(query)
+                cur.execute(stage_query)
+                conn.commit()
+            _initialized = True
 
-def save_url(category: str, subcategory: str, others: str, url: str):
+def save_url(category: str, subcategory: str, others: str, url: str, conn=None):
     """Save a single URL to the database (skip duplicates)."""
-    conn = get_connection()
+    with _use_connection(conn) as conn:
+        if not conn:
+            print("DB connection failed. URL not saved:", url)
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO url_collection (category, subcategory, others, url)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (url) DO NOTHING
+                """, (category, subcategory, others, url))
+                conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print("Error saving URL:", url, e)
+            return False
+
+def save_urls_bulk(conn, rows: list) -> int:
+    """Save a batch of (category, subcategory, others, url) rows in one statement.
+    Returns how many rows were actually inserted (duplicates are skipped)."""
+    # Repeats inside one INSERT would only churn ON CONFLICT; keep the first of each
+    rows = list(dict.fromkeys(rows))
+    if not rows:
+        return 0
     if not conn:
-        print("DB connection failed. URL not saved:", url)
-        return False
+        print("DB connection failed. URLs not saved:", len(rows))
+        return 0
     try:
         with conn.cursor() as cur:
-            cur.execute("""
+            inserted = execute_values(cur, """
                 INSERT INTO url_collection (category, subcategory, others, url)
-                VALUES (%s, %s, %s, %s)
+                VALUES %s
                 ON CONFLICT (url) DO NOTHING
-            """, (category, subcategory, others, url))
+                RETURNING 1
+            """, rows, page_size=100, fetch=True)
             conn.commit()
-        return True
+        return len(inserted)
     except Exception as e:
-        print("Error saving URL:", url, e)
-        return False
-    finally:
-        conn.close()
+        conn.rollback()
+        print("Error saving URLs:", len(rows), e)
+        return 0
 
-def load_saved_urls(category: str, subcategory: str, others: str) -> set:
-    """Return a set of URLs already saved for this subcategory & brand."""
-    conn = get_connection()
-    seen = set()
+def filter_new_urls(conn, urls: list) -> list:
+    """Return the URLs (deduplicated, in order) not yet stored in url_collection.
+    Read-only, so batch insert mode can tell new pages from duplicate ones before flushing."""
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return []
     if not conn:
-        return seen
+        print("DB connection failed. URLs not checked:", len(urls))
+        return []
     try:
         with conn.cursor() as cur:
             cur.execute("""
-                SELECT url FROM url_collection WHERE category=%s AND subcategory=%s AND others=%s
-            """, (category, subcategory, others))
+                SELECT u.url FROM unnest(%s::text[]) WITH ORDINALITY AS u(url, ord)
+                WHERE NOT EXISTS (SELECT 1 FROM url_collection c WHERE c.url = u.url)
+                ORDER BY u.ord
+            """, (urls,))
             rows = cur.fetchall()
-            for r in rows:
-                seen.add(r[0])
+        conn.commit()
+        return [r[0] for r in rows]
     except Exception as e:
-        print("Error loading saved URLs:", e)
-    finally:
-        conn.close()
+        conn.rollback()
+        print("Error checking URLs:", len(urls), e)
+        return []
+
+def save_urls_staged(conn, rows: list) -> int:
+    """Batch insert mode: COPY (category, subcategory, others, url) rows into the
+    staging table, then move them into url_collection with flush_stage().
+    Returns how many rows were actually inserted (duplicates are skipped)."""
+    rows = list(dict.fromkeys(rows))
+    if not rows:
+        return 0
+    if not conn:
+        print("DB connection failed. URLs not saved:", len(rows))
+        return 0
+    buf = io.StringIO()
+    # Quote every field: COPY reads an unquoted empty CSV field as NULL, not ''
+    csv.writer(buf, quoting=csv.QUOTE_ALL).writerows(rows)
+    buf.seek(0)
+    try:
+        with conn.cursor() as cur:
+            # Held until flush_stage() commits, so concurrent workers never truncate each other's rows
+            cur.execute("LOCK TABLE url_collection_stage IN EXCLUSIVE MODE")
+            cur.copy_expert("""
+                COPY url_collection_stage (category, subcategory, others, url) FROM STDIN WITH (FORMAT csv)
+            """, buf)
+        return flush_stage(conn)
+    except Exception as e:
+        conn.rollback()
+        print("Error staging URLs:", len(rows), e)
+        return 0
+
+def flush_stage(conn) -> int:
+    """Move staged rows into url_collection and empty the staging table in one transaction."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO url_collection (category, subcategory, others, url)
+            SELECT DISTINCT ON (url) category, subcategory, others, url FROM url_collection_stage
+            ON CONFLICT (url) DO NOTHING
+        """)
+        inserted = cur.rowcount
+        cur.execute("TRUNCATE url_collection_stage")
+        conn.commit()
+    return inserted
+
+def load_saved_urls(category: str, subcategory: str, others: str, conn=None) -> set:
+    """Return a set of URLs already saved for this subcategory & brand."""
+    seen = set()
+    with _use_connection(conn) as conn:
+        if not conn:
+            return seen
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT url FROM url_collection WHERE category=%s AND subcategory=%s AND others=%s
+                """, (category, subcategory, others))
+                rows = cur.fetchall()
+                for r in rows:
+                    seen.add(r[0])
+        except Exception as e:
+            conn.rollback()
+            print("Error loading saved URLs:", e)
     return seen
@@ -1,23 +1,33 @@
 import os
-import time
 import random
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from math import ceil
 from typing import Dict, Any, Optional
-from db.db_operations import init_db, save_url, load_saved_urls
+from config.db_config import DB_POOL_MAXCONN
+from db.db_connection import pooled_connection
+from db.db_operations import init_db, save_urls_bulk, save_urls_staged, filter_new_urls
 import pandas as pd
 import logging
-from logging.handlers import RotatingFileHandler
+import atexit
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
 from datetime import datetime
-import json
+import orjson
+import sqlite3
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # ---------- CONFIG ----------
 EXCEL_FILE = "sheets/Catawiki4_14.xlsx"
-CHECKPOINT_FILE = "crawler_checkpoint.json"
+EXCEL_ENGINE = "calamine"  # Rust reader from python-calamine, much faster than openpyxl
+CHECKPOINT_DB = "crawler_checkpoint.db"
+LEGACY_CHECKPOINT_FILE = "crawler_checkpoint.json"  # pre-SQLite format, still read on resume
 LOG_FILE = "crawler.log"
 
 # Oxylabs credentials
@@ -29,8 +39,17 @@ DEFAULT_MAX_START = 3000
 REQUEST_SLEEP = (1.0, 2.0)
 FIRST_SLEEP = (2.0, 4.0)
 MAX_RETRIES = 5
+# Truncated or malformed response bodies; the session's Retry only covers connecting and status codes
+RETRY_BODY_ERRORS = (requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError,
+                     orjson.JSONDecodeError)
+CHECKPOINT_INTERVAL_PAGES = 5  # persist pagination progress every N pages
 MAX_CONSECUTIVE_EMPTY = 2
 OXYLABS_ENDPOINT = "https://realtime.oxylabs.io/v1/queries"
+# Brands crawled in parallel; keep within the Oxylabs concurrency quota and DB_POOL_MAXCONN
+MAX_CONCURRENT_BRANDS = int(os.getenv("MAX_CONCURRENT_BRANDS", 4))
+# Batch insert mode for large backfills: buffer this many new URLs per brand and load them through
+# the UNLOGGED staging table with COPY. 0 inserts each page directly.
+STAGE_BATCH_SIZE = int(os.getenv("STAGE_BATCH_SIZE", 0))
 
 # ---------- LOGGING ----------
 def setup_logging():
@@ -40,31 +59,82 @@ def setup_logging():
     fh.setLevel(logging.INFO)
     fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
     fh.setFormatter(fmt)
-    logger.addHandler(fh)
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
     ch.setFormatter(fmt)
-    logger.addHandler(ch)
+    # File and console writes happen on the listener thread, not in the crawl loop
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, fh, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
 
 setup_logging()
 logger = logging.getLogger("crawler")
 
 # ---------- CHECKPOINT ----------
+checkpoint_lock = threading.Lock()
+
+_ck_conn: Optional[sqlite3.Connection] = None
+
+def get_checkpoint_db() -> sqlite3.Connection:
+    """Open the single-row SQLite checkpoint store (WAL, autocommit) on first use."""
+    global _ck_conn
+    if _ck_conn is None:
+        conn = sqlite3.connect(CHECKPOINT_DB, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ck (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                sheet TEXT, category TEXT, subcategory TEXT, brand TEXT,
+                start INT, page_num INT, ts TEXT
+            )
+        """)
+        _ck_conn = conn
+    return _ck_conn
+
 def load_checkpoint() -> Optional[Dict[str, Any]]:
-    if Path(CHECKPOINT_FILE).exists():
+    try:
+        row = get_checkpoint_db().execute(
+            "SELECT sheet, category, subcategory, brand, start, page_num, ts FROM ck WHERE id = 1"
+        ).fetchone()
+        if row:
+            return dict(zip(("sheet", "category", "subcategory", "brand", "start", "page_num", "timestamp"), row))
+    except Exception:
+        logger.exception("Failed to read checkpoint database; starting fresh.")
+        return None
+    # Pick up a checkpoint left by the old JSON format; the next save moves it to SQLite
+    if Path(LEGACY_CHECKPOINT_FILE).exists():
         try:
-            with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(LEGACY_CHECKPOINT_FILE, "rb") as f:
+                return orjson.loads(f.read())
         except Exception:
             logger.exception("Failed to read checkpoint file; starting fresh.")
     return None
 
-def save_checkpoint(state: Dict[str, Any], log: bool = False):
-    tmp = CHECKPOINT_FILE + ".tmp"
+_last_saved_state: Optional[Dict[str, Any]] = None
+
+def save_checkpoint(state: Dict[str, Any], log: bool = False, force: bool = True):
+    """
+    Persist the checkpoint. With force=False the write is skipped unless the crawl moved
+    to another sheet/subcategory/brand or reached a CHECKPOINT_INTERVAL_PAGES boundary,
+    so a crash re-crawls at most that many pages (duplicates are skipped by the DB).
+    """
+    global _last_saved_state
+    if not force and _last_saved_state is not None:
+        if state == _last_saved_state:
+            return
+        moved = any(state.get(k) != _last_saved_state.get(k) for k in ("sheet", "subcategory", "brand"))
+        if not moved and state.get("page_num", 0) % CHECKPOINT_INTERVAL_PAGES:
+            return
     try:
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(state, f, indent=2)
-        os.replace(tmp, CHECKPOINT_FILE)
+        get_checkpoint_db().execute("""
+            INSERT OR REPLACE INTO ck (id, sheet, category, subcategory, brand, start, page_num, ts)
+            VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+        """, (state.get("sheet"), state.get("category"), state.get("subcategory"), state.get("brand"),
+              state.get("start"), state.get("page_num"), state.get("timestamp")))
+        _last_saved_state = dict(state)
         if log:
             logger.info(f"Checkpoint saved: sheet={state.get('sheet')} | category={state.get('category')} | "
                         f"subcategory={state.get('subcategory')} | brand={state.get('brand')} | start={state.get('start')}")
@@ -73,46 +143,41 @@ def save_checkpoint(state: Dict[str, Any], log: bool = False):
 
 def clear_checkpoint():
     try:
-        if Path(CHECKPOINT_FILE).exists():
-            Path(CHECKPOINT_FILE).unlink()
-            logger.info("Checkpoint cleared.")
+        get_checkpoint_db().execute("DELETE FROM ck WHERE id = 1")
+        if Path(LEGACY_CHECKPOINT_FILE).exists():
+            Path(LEGACY_CHECKPOINT_FILE).unlink()
+        logger.info("Checkpoint cleared.")
     except Exception:
-        logger.exception("Failed to clear checkpoint file.")
+        logger.exception("Failed to clear checkpoint.")
 
 # ---------- EXCEL LOADER ----------
 def load_subcategories_from_excel(file_path: str, sheet_name: str):
     try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        df = pd.read_excel(file_path, sheet_name=sheet_name, engine=EXCEL_ENGINE)
     except Exception:
         logger.exception(f"Failed to read Excel sheet: {sheet_name}")
         raise
     if df.empty:
         raise ValueError(f"Excel sheet '{sheet_name}' is empty!")
-    CATEGORY = str(df.iloc[0]['Category']).strip()
-    subcategories = {}
-    row_mapping = {}
-    for idx, row in df.iterrows():
-        subcategory = str(row['SubCategories']).strip()
-        brand = str(row['Brand']).strip()
-        subcategories.setdefault(subcategory, [])
-        if brand not in subcategories[subcategory]:
-            subcategories[subcategory].append(brand)
-        row_mapping[(subcategory, brand)] = idx + 2
+    CATEGORY = str(df['Category'].iloc[0]).strip()
+    df['SubCategories'] = df['SubCategories'].astype(str).str.strip()
+    df['Brand'] = df['Brand'].astype(str).str.strip()
+    # Unique brands per subcategory, both in sheet order
+    subcategories = df.groupby('SubCategories', sort=False)['Brand'].apply(lambda s: list(dict.fromkeys(s))).to_dict()
+    # Excel row number (1-based, after the header) of the last row for each pair
+    row_mapping = dict(zip(zip(df['SubCategories'], df['Brand']), (df.index + 2).tolist()))
     return CATEGORY, subcategories, row_mapping
 
 # ---------- OXYLABS SEARCH ----------
-def oxylabs_search(session: requests.Session, query: str, start: int = 0, num: int = 100):
+def build_oxylabs_payload(query: str) -> dict:
     """
-    Perform Google search via Oxylabs Realtime API.
-    Oxylabs uses 'start_page' parameter (1-indexed) instead of 'start' offset.
+    Build the request payload for one brand's query.
+    Built once per brand; oxylabs_search only updates 'start_page' for each page.
     """
-    # Convert start offset to page number (1-indexed)
-    page = (start // num) + 1
-    
-    payload = {
+    return {
         'source': 'google_search',
         'query': query,
-        'start_page': page,
+        'start_page': 1,
         'pages': 1,
         'parse': True,
         'context': [
@@ -120,7 +185,15 @@ def oxylabs_search(session: requests.Session, query: str, start: int = 0, num: i
             {'key': 'results_language', 'value': 'en'}
         ]
     }
-    
+
+def oxylabs_search(session: requests.Session, payload: dict, start: int = 0, num: int = 100):
+    """
+    Perform Google search via Oxylabs Realtime API.
+    Oxylabs uses 'start_page' parameter (1-indexed) instead of 'start' offset.
+    """
+    # Convert start offset to page number (1-indexed)
+    payload['start_page'] = (start // num) + 1
+
     return session.post(
         OXYLABS_ENDPOINT,
         auth=(OXYLABS_USERNAME, OXYLABS_PASSWORD),
@@ -128,53 +201,249 @@ def oxylabs_search(session: requests.Session, query: str, start: int = 0, num: i
         timeout=60
     )
 
-def extract_results_from_oxylabs(data: dict):
+def get_results_block(data: dict) -> dict:
     """
-    Extract organic results from Oxylabs response.
-    Oxylabs structure: data['results'][0]['content']['results']['organic']
+    Return the parsed results block of an Oxylabs response, walked once per page.
+    Oxylabs structure: data['results'][0]['content']['results']
     """
     try:
         results = data.get('results', [])
         if not results:
-            return []
-        
-        content = results[0].get('content', {})
-        organic = content.get('results', {}).get('organic', [])
-        return organic
-    except (IndexError, KeyError, TypeError) as e:
-        logger.warning(f"Failed to extract organic results: {e}")
-        return []
-
-def extract_total_results(data: dict) -> Optional[int]:
+            return {}
+
+        block = results[0].get('content', {}).get('results', {})
+        return block if isinstance(block, dict) else {}
+    except (IndexError, KeyError, AttributeError, TypeError) as e:
+        logger.warning(f"Failed to read Oxylabs results block: {e}")
+        return {}
+
+def extract_results_from_oxylabs(block: dict):
+    """
+    Extract organic results from the results block (see get_results_block).
     """
-    Extract total results count from Oxylabs response.
+    organic = block.get('organic', [])
+    return organic if isinstance(organic, list) else []
+
+def extract_total_results(block: dict) -> Optional[int]:
+    """
+    Extract total results count from the results block (see get_results_block).
     """
     try:
-        results = data.get('results', [])
-        if not results:
-            return None
-        
-        content = results[0].get('content', {})
-        search_info = content.get('results', {}).get('search_information', {})
+        search_info = block.get('search_information', {})
         total = search_info.get('total_results_count')
         
         if total:
             # Remove commas and convert to int
             return int(str(total).replace(',', ''))
-    except (IndexError, KeyError, ValueError, TypeError):
+    except (AttributeError, ValueError, TypeError):
         pass
     
     return None
 
 def extract_link_from_result(result: dict) -> str:
     """Extract URL from Oxylabs result."""
-    for key in ("url", "link"):
-        val = result.get(key)
-        if isinstance(val, str) and val.startswith("http"):
-            return val
-    return ""
+    # Oxylabs organic results almost always carry 'url'; 'link' is the fallback
+    url = result.get("url")
+    if isinstance(url, str) and url.startswith("http"):
+        return url
+    url = result.get("link")
+    return url if isinstance(url, str) and url.startswith("http") else ""
 
 # ---------- CRAWLER ----------
+def record_progress(ck: Dict[str, Any], progress: Dict[str, Any], job_idx: int,
+                    state: Optional[Dict[str, Any]] = None):
+    """
+    Update the progress of one brand worker and checkpoint the lowest job that has not
+    finished, whether it is running or not started yet. Once every job is done the
+    checkpoint is left on the sheet's last brand at its final page, as in a sequential run.
+    Pass state=None once the brand is finished; that always writes the checkpoint, while
+    page updates are throttled by save_checkpoint(force=False). Brands after the
+    checkpointed one that already finished are re-crawled on resume (the DB skips duplicates).
+    """
+    jobs = progress["jobs"]
+    in_flight = progress["in_flight"]
+    with checkpoint_lock:
+        if state is None:
+            final_state = in_flight.pop(job_idx, None)
+            if job_idx == len(jobs) - 1:
+                progress["last_state"] = final_state
+            progress["done"].add(job_idx)
+            while progress["next_job"] in progress["done"]:
+                progress["next_job"] += 1
+            # Only stamped on brand boundaries; nothing on resume reads it
+            ck["timestamp"] = datetime.utcnow().isoformat()
+        else:
+            in_flight[job_idx] = state
+
+        next_job = progress["next_job"]
+        if next_job < len(jobs):
+            subcategory, brand, start, page_num = jobs[next_job]
+            ck.update(in_flight.get(next_job) or {"subcategory": subcategory, "brand": brand,
+                                                   "start": start, "page_num": page_num})
+        elif progress["last_state"]:
+            ck.update(progress["last_state"])
+        save_checkpoint(ck, force=state is None)
+
+def crawl_brand(session: requests.Session, category: str, subcategory: str, brand: str, row_number,
+                start: int, page_num: int, ck: Dict[str, Any], progress: Dict[str, Any],
+                job_idx: int, stop_event: threading.Event) -> Dict[str, Any]:
+    """Crawl every result page for one (subcategory, brand) pair. Runs in a worker thread."""
+    brand_urls = 0
+    consecutive_empty = 0
+    max_start = DEFAULT_MAX_START
+    finished = True
+    pending = {}  # url -> row waiting for the next staged flush (batch insert mode only)
+    pending_since = None  # (start, page_num) of the oldest page in pending
+
+    with pooled_connection() as conn:
+        try:
+            record_progress(ck, progress, job_idx, {"subcategory": subcategory, "brand": brand,
+                                                   "start": start, "page_num": page_num})
+
+            logger.info(f"\n{'='*100}\nCrawling -> Row: {row_number} | Category: '{category}' | "
+                        f"Subcategory: '{subcategory}' | Brand: '{brand}'")
+
+            if stop_event.wait(random.uniform(*FIRST_SLEEP)):
+                finished = False
+                return _brand_stats(row_number, category, subcategory, brand, page_num, brand_urls)
+
+            # Subcategory and brand are already stripped by load_subcategories_from_excel
+            query = f'site:catawiki.com/en/l/ "{subcategory}" "{brand}" ("Sold" OR "Final bid")'
+            payload = build_oxylabs_payload(query)
+
+            # First request to get total results estimate
+            try:
+                first_resp = oxylabs_search(session, payload, start=0, num=RESULTS_PER_PAGE)
+                first_resp.raise_for_status()
+                first_data = orjson.loads(first_resp.content)
+                total_results = extract_total_results(get_results_block(first_data))
+
+                if total_results and total_results > 0:
+                    estimated_pages = ceil(total_results / RESULTS_PER_PAGE)
+                    max_start = (estimated_pages - 1) * RESULTS_PER_PAGE
+                    logger.info(f"[{brand}] Estimated total results: {total_results} | Estimated pages: {estimated_pages} | MAX_START={max_start}")
+                else:
+                    logger.info(f"[{brand}] Total results estimate: N/A | Using default MAX_START: {DEFAULT_MAX_START}")
+            except Exception as e:
+                logger.warning(f"[{brand}] First request failed: {e}. Using default MAX_START.")
+
+            # Pagination
+            while start <= max_start:
+                # Never checkpoint past a page whose URLs are still only buffered in pending
+                ck_start, ck_page_num = pending_since or (start, page_num)
+                record_progress(ck, progress, job_idx, {"subcategory": subcategory, "brand": brand,
+                                                       "start": ck_start, "page_num": ck_page_num})
+
+                if stop_event.wait(random.uniform(*REQUEST_SLEEP)):
+                    finished = False
+                    break
+                data = None
+
+                for attempt in range(1, MAX_RETRIES + 1):
+                    try:
+                        resp = oxylabs_search(session, payload, start=start, num=RESULTS_PER_PAGE)
+                        resp.raise_for_status()
+                        data = orjson.loads(resp.content)
+                        break
+                    except RETRY_BODY_ERRORS as e:
+                        backoff = (2 ** attempt) + random.random()
+                        logger.warning("[%s] Bad response body (attempt %d/%d) | start=%d: %s. Backing off %.1fs",
+                                       brand, attempt, MAX_RETRIES, start, e, backoff)
+                        if stop_event.wait(backoff):
+                            break
+                    except requests.RequestException as e:
+                        # Connection errors and 429/5xx responses were already retried by the session adapter
+                        logger.error("[%s] Skipping start=%d | Request failed: %s", brand, start, e)
+                        break
+                else:
+                    logger.error("[%s] Skipping start=%d after %d failed attempts", brand, start, MAX_RETRIES)
+
+                if stop_event.is_set():
+                    finished = False
+                    break
+
+                if data is None:
+                    consecutive_empty += 1
+                    start += RESULTS_PER_PAGE
+                    continue
+
+                block = get_results_block(data)
+                organic = extract_results_from_oxylabs(block)
+                total_results = extract_total_results(block)
+                logger.debug("[%s] start=%d (page %d) | Organic results: %d | Total results estimate: %s",
+                             brand, start, page_num + 1, len(organic), total_results or 'N/A')
+
+                rows = []
+                for result in organic:
+                    link = extract_link_from_result(result)
+                    if "catawiki.com/en/l/" in link:
+                        clean = link.partition("&")[0]
+                        rows.append((category, subcategory, brand, clean))
+
+                found_this_page = 0
+                if STAGE_BATCH_SIZE:
+                    # One read-only lookup tells which URLs are new, so the empty-page stop
+                    # still works per page while the writes are batched through the stage
+                    new_urls = filter_new_urls(conn, [row[3] for row in rows if row[3] not in pending])
+                    found_this_page = len(new_urls)
+                    if new_urls and pending_since is None:
+                        pending_since = (start, page_num)
+                    for url in new_urls:
+                        pending[url] = (category, subcategory, brand, url)
+                    if len(pending) >= STAGE_BATCH_SIZE:
+                        try:
+                            brand_urls += save_urls_staged(conn, list(pending.values()))
+                        except Exception:
+                            logger.exception(f"Failed to save {len(pending)} staged URLs for brand='{brand}'")
+                        pending = {}
+                        pending_since = None
+                elif rows:
+                    try:
+                        found_this_page = save_urls_bulk(conn, rows)
+                    except Exception:
+                        logger.exception(f"Failed to save {len(rows)} URLs for brand='{brand}'")
+                    brand_urls += found_this_page
+
+                logger.debug("[%s] Page %d | Found this page: %d", brand, page_num + 1, found_this_page)
+                consecutive_empty = consecutive_empty + 1 if found_this_page == 0 else 0
+                page_num += 1
+
+                if consecutive_empty >= MAX_CONSECUTIVE_EMPTY:
+                    logger.info(f"{MAX_CONSECUTIVE_EMPTY} consecutive empty pages. Stopping pagination for brand='{brand}'")
+                    break
+
+                if start + RESULTS_PER_PAGE > max_start:
+                    logger.info(f"Reached MAX_START ({max_start}) for brand='{brand}'. Stopping pagination.")
+                    break
+
+                start += RESULTS_PER_PAGE
+
+        except Exception:
+            logger.exception(f"Exception processing brand='{brand}'. Continuing with next brand...")
+
+        finally:
+            if pending:
+                try:
+                    brand_urls += save_urls_staged(conn, list(pending.values()))
+                except Exception:
+                    logger.exception(f"Failed to save {len(pending)} staged URLs for brand='{brand}'")
+            # An interrupted brand stays in the checkpoint so the next run resumes it
+            if finished:
+                record_progress(ck, progress, job_idx)
+
+    logger.info("[%s] Finished brand | Pages crawled: %d | New URLs: %d", brand, page_num, brand_urls)
+    return _brand_stats(row_number, category, subcategory, brand, page_num, brand_urls)
+
+def _brand_stats(row_number, category: str, subcategory: str, brand: str, page_num: int, brand_urls: int) -> Dict[str, Any]:
+    return {
+        "Row": row_number,
+        "Category": category,
+        "Subcategory": subcategory,
+        "Brand": brand,
+        "Pages Crawled": page_num,
+        "Total URLs": brand_urls
+    }
+
 def crawl(sheet_name: str, resume_state: Optional[Dict[str, Any]] = None):
     logger.info(f"\n{'#'*100}\nProcessing sheet: {sheet_name}\n{'#'*100}")
     CATEGORY, SUBCATEGORIES, ROW_MAPPING = load_subcategories_from_excel(EXCEL_FILE, sheet_name)
@@ -185,8 +454,18 @@ def crawl(sheet_name: str, resume_state: Optional[Dict[str, Any]] = None):
 
     init_db()
     total_urls_found = 0
+
+    # Every worker holds one pooled DB connection for its brand, so never outnumber the pool
+    workers = min(MAX_CONCURRENT_BRANDS, DB_POOL_MAXCONN)
+    if workers < MAX_CONCURRENT_BRANDS:
+        logger.warning(f"MAX_CONCURRENT_BRANDS={MAX_CONCURRENT_BRANDS} exceeds DB_POOL_MAXCONN; using {workers} workers")
+
     session = requests.Session()
-    log_stats = []
+    # Keep-alive connection pool; urllib3 retries connection errors and 429/5xx with exponential backoff
+    retry = Retry(total=MAX_RETRIES, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=frozenset({"POST"}))
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=max(20, workers), max_retries=retry)
+    session.mount("https://", adapter)
 
     ck = {
         "sheet": sheet_name,
@@ -207,168 +486,79 @@ def crawl(sheet_name: str, resume_state: Optional[Dict[str, Any]] = None):
         })
         logger.info(f"Resuming from checkpoint: {ck}")
 
-    # Track if we're still looking for the resume point
-    skip_until_resume = resume_state is not None
+    # Build the ordered list of brands to crawl, starting at the checkpointed one
+    sub_keys = list(SUBCATEGORIES.keys())
+    resume_sub_idx = 0
+    resume_brand_idx = 0
+    resume_exact = False
+
+    if resume_state:
+        resume_sub = resume_state.get("subcategory")
+        resume_brand = resume_state.get("brand")
+        if resume_sub in SUBCATEGORIES:
+            resume_sub_idx = sub_keys.index(resume_sub)
+            if resume_brand in SUBCATEGORIES[resume_sub]:
+                resume_brand_idx = SUBCATEGORIES[resume_sub].index(resume_brand)
+                resume_exact = True
+            else:
+                logger.warning(f"Checkpoint brand '{resume_brand}' not found; restarting subcategory '{resume_sub}'")
+        else:
+            logger.warning(f"Checkpoint subcategory '{resume_sub}' not found; starting sheet from the beginning")
+        if resume_sub_idx or resume_brand_idx:
+            logger.info(f"Skipping {resume_sub_idx} subcategories and {resume_brand_idx} brands (before checkpoint)")
+
+    jobs = []
+    for subcategory in sub_keys[resume_sub_idx:]:
+        brands = SUBCATEGORIES[subcategory]
+        if resume_brand_idx:
+            brands = brands[resume_brand_idx:]
+            resume_brand_idx = 0
+        jobs.extend((subcategory, brand, 0, 0) for brand in brands)
+
+    if resume_exact:
+        subcategory, brand, _, _ = jobs[0]
+        start = resume_state.get("start", 0)
+        page_num = resume_state.get("page_num", 0)
+        jobs[0] = (subcategory, brand, start, page_num)
+        logger.info(f"Resuming brand '{brand}' from page {page_num}, start={start}")
+
+    # Brands are crawled concurrently; the checkpoint always tracks the lowest unfinished job
+    progress = {
+        "jobs": jobs,
+        "in_flight": {},   # job_idx -> latest page state of a running brand
+        "done": set(),
+        "next_job": 0,     # lowest job_idx not yet finished
+        "last_state": None
+    }
+    stop_event = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="brand")
+    stats_by_job = {}
 
     try:
-        for subcategory, brands in SUBCATEGORIES.items():
-            # Skip entire subcategories before the checkpoint
-            if skip_until_resume:
-                resume_sub = resume_state.get("subcategory")
-                if subcategory != resume_sub:
-                    logger.info(f"Skipping subcategory '{subcategory}' (before checkpoint)")
-                    continue
-            
-            for brand in brands:
-                row_number = ROW_MAPPING.get((subcategory, brand), "Unknown")
-                page_num = 0
-                brand_urls = 0
-                consecutive_empty = 0
-                start = 0
-                max_start = DEFAULT_MAX_START
-
-                try:
-                    # Handle resume logic
-                    if skip_until_resume:
-                        resume_sub = resume_state.get("subcategory")
-                        resume_brand = resume_state.get("brand")
-                        
-                        # Within the checkpoint subcategory, skip brands before the checkpoint
-                        if subcategory == resume_sub and brand != resume_brand:
-                            # Check if this brand comes before the resume brand in the list
-                            brands_in_sub = SUBCATEGORIES[subcategory]
-                            try:
-                                if brands_in_sub.index(brand) < brands_in_sub.index(resume_brand):
-                                    logger.info(f"Skipping brand '{brand}' (before checkpoint)")
-                                    continue
-                            except ValueError:
-                                # If brand not in list (shouldn't happen), process it
-                                pass
-                        
-                        # Exact match - resume from checkpoint
-                        if subcategory == resume_sub and brand == resume_brand:
-                            start = resume_state.get("start", 0)
-                            page_num = resume_state.get("page_num", 0)
-                            logger.info(f"Resuming brand '{brand}' from page {page_num}, start={start}")
-                            skip_until_resume = False  # Clear flag after resuming
-
-                    ck["subcategory"] = subcategory
-                    ck["brand"] = brand
-                    ck["start"] = start
-                    ck["page_num"] = page_num
-
-                    logger.info(f"\n{'='*100}\nCrawling -> Row: {row_number} | Category: '{CATEGORY}' | "
-                                f"Subcategory: '{subcategory}' | Brand: '{brand}'")
-
-                    time.sleep(random.uniform(*FIRST_SLEEP))
-                    seen_urls = load_saved_urls(CATEGORY, subcategory, brand)
-
-                    query = f'site:catawiki.com/en/l/ "{subcategory.strip()}" "{brand.strip()}" ("Sold" OR "Final bid")'
-
-                    # First request to get total results estimate
-                    try:
-                        first_resp = oxylabs_search(session, query, start=0, num=RESULTS_PER_PAGE)
-                        first_resp.raise_for_status()
-                        first_data = first_resp.json()
-                        total_results = extract_total_results(first_data)
-                        
-                        if total_results and total_results > 0:
-                            estimated_pages = ceil(total_results / RESULTS_PER_PAGE)
-                            max_start = (estimated_pages - 1) * RESULTS_PER_PAGE
-                            logger.info(f"Estimated total results: {total_results} | Estimated pages: {estimated_pages} | MAX_START={max_start}")
-                        else:
-                            logger.info(f"Total results estimate: N/A | Using default MAX_START: {DEFAULT_MAX_START}")
-                    except Exception as e:
-                        logger.warning(f"First request failed: {e}. Using default MAX_START.")
-
-                    # Pagination
-                    while start <= max_start:
-                        try:
-                            ck.update({"start": start, "page_num": page_num, "timestamp": datetime.utcnow().isoformat()})
-                            save_checkpoint(ck)
-
-                            time.sleep(random.uniform(*REQUEST_SLEEP))
-                            data = None
-                            
-                            for attempt in range(1, MAX_RETRIES + 1):
-                                try:
-                                    resp = oxylabs_search(session, query, start=start, num=RESULTS_PER_PAGE)
-                                    resp.raise_for_status()
-                                    data = resp.json()
-                                    break
-                                except requests.RequestException as e:
-                                    backoff = (2 ** attempt) + random.random()
-                                    logger.warning(f"Request error (attempt {attempt}/{MAX_RETRIES}) | start={start}: {e}. Backing off {backoff:.1f}s")
-                                    time.sleep(backoff)
-
-                            if data is None:
-                                logger.error(f"Skipping start={start} after {MAX_RETRIES} failed attempts.")
-                                consecutive_empty += 1
-                                start += RESULTS_PER_PAGE
-                                continue
-
-                            organic = extract_results_from_oxylabs(data)
-                            total_results = extract_total_results(data)
-                            logger.info(f"start={start} (page {page_num+1}) | Organic results: {len(organic)} | Total results estimate: {total_results or 'N/A'}")
-
-                            found_this_page = 0
-                            for result in organic:
-                                link = extract_link_from_result(result)
-                                if "catawiki.com/en/l/" in link:
-                                    clean = link.split("&")[0]
-                                    if clean not in seen_urls:
-                                        seen_urls.add(clean)
-                                        try:
-                                            if save_url(CATEGORY, subcategory, brand, clean):
-                                                total_urls_found += 1
-                                                found_this_page += 1
-                                                brand_urls += 1
-                                        except Exception:
-                                            logger.exception(f"Failed to save URL: {clean}")
-
-                            logger.info(f"Page {page_num+1} | Found this page: {found_this_page}")
-                            page_num += 1
-
-                            if found_this_page == 0:
-                                consecutive_empty += 1
-                                if consecutive_empty >= MAX_CONSECUTIVE_EMPTY:
-                                    logger.info(f"{MAX_CONSECUTIVE_EMPTY} consecutive empty pages. Stopping pagination for brand='{brand}'")
-                                    break
-                            else:
-                                consecutive_empty = 0
-
-                            if start + RESULTS_PER_PAGE > max_start:
-                                logger.info(f"Reached MAX_START ({max_start}) for brand='{brand}'. Stopping pagination.")
-                                break
-
-                            start += RESULTS_PER_PAGE
-
-                        except KeyboardInterrupt:
-                            logger.warning("Interrupted! Saving checkpoint and exiting...")
-                            save_checkpoint(ck, log=True)
-                            raise
-
-                except Exception:
-                    logger.exception(f"Exception processing brand='{brand}'. Continuing with next brand...")
-
-                finally:
-                    log_stats.append({
-                        "Row": row_number,
-                        "Category": CATEGORY,
-                        "Subcategory": subcategory,
-                        "Brand": brand,
-                        "Pages Crawled": page_num,
-                        "Total URLs": brand_urls
-                    })
-                    
-                    save_checkpoint(ck)
+        futures = {
+            executor.submit(crawl_brand, session, CATEGORY, subcategory, brand,
+                            ROW_MAPPING.get((subcategory, brand), "Unknown"),
+                            start, page_num, ck, progress, job_idx, stop_event): job_idx
+            for job_idx, (subcategory, brand, start, page_num) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            stats = future.result()
+            stats_by_job[futures[future]] = stats
+            total_urls_found += stats["Total URLs"]
 
     except KeyboardInterrupt:
         logger.warning("Interrupted by user. Saving checkpoint and exiting...")
-        save_checkpoint(ck, log=True)
+        stop_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        with checkpoint_lock:
+            ck["timestamp"] = datetime.utcnow().isoformat()
+            save_checkpoint(ck, log=True)
         raise
 
     finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        # Brands finish out of order; report them in sheet order
+        log_stats = [stats_by_job[job_idx] for job_idx in sorted(stats_by_job)]
         logger.info("\n" + "="*100)
         logger.info(f"{'Row':<5} {'Category':<30} {'Subcategory':<30} {'Brand':<15} {'Pages Crawled':<15} {'Total URLs':<10}")
         logger.info("-"*100)
@@ -382,7 +572,7 @@ def crawl(sheet_name: str, resume_state: Optional[Dict[str, Any]] = None):
 if __name__ == "__main__":
     resume = load_checkpoint()
     try:
-        xls = pd.ExcelFile(EXCEL_FILE)
+        xls = pd.ExcelFile(EXCEL_FILE, engine=EXCEL_ENGINE)
     except Exception:
         logger.exception(f"Failed to open Excel workbook: {EXCEL_FILE}")
         raise
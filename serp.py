@@ -2,20 +2,28 @@ import os
 import time
 import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from math import ceil
 from typing import Dict, Any, Optional
-from db.db_operations import init_db, save_url, load_saved_urls
+from db.db_connection import pooled_connection
+from db.db_operations import init_db, save_urls_bulk
 import pandas as pd
 import logging
-from logging.handlers import RotatingFileHandler
+import atexit
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
 from datetime import datetime
-import json
+import orjson
+import sqlite3
 from dotenv import load_dotenv
 load_dotenv()
 # ---------- CONFIG ----------
 EXCEL_FILE = "sheets/Catawiki category.xlsx"
-CHECKPOINT_FILE = "crawler_checkpoint.json"
+EXCEL_ENGINE = "calamine"  # Rust reader from python-calamine, much faster than openpyxl
+CHECKPOINT_DB = "crawler_checkpoint.db"
+LEGACY_CHECKPOINT_FILE = "crawler_checkpoint.json"  # pre-SQLite format, still read on resume
 LOG_FILE = "crawler.log"
 
 API_KEY =  os.getenv("SERP_API_KEY")  # Replace with your actual key
@@ -24,6 +32,10 @@ DEFAULT_MAX_START = 3000
 REQUEST_SLEEP = (1.0, 2.0)
 FIRST_SLEEP = (2.0, 4.0)
 MAX_RETRIES = 5
+# Truncated or malformed response bodies; the session's Retry only covers connecting and status codes
+RETRY_BODY_ERRORS = (requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError,
+                     orjson.JSONDecodeError)
+CHECKPOINT_INTERVAL_PAGES = 5  # persist pagination progress every N pages
 MAX_CONSECUTIVE_EMPTY = 3
 SERPAPI_ENDPOINT = "https://serpapi.com/search"
 
@@ -35,31 +47,80 @@ def setup_logging():
     fh.setLevel(logging.INFO)
     fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
     fh.setFormatter(fmt)
-    logger.addHandler(fh)
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
     ch.setFormatter(fmt)
-    logger.addHandler(ch)
+    # File and console writes happen on the listener thread, not in the crawl loop
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, fh, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
 
 setup_logging()
 logger = logging.getLogger("crawler")
 
 # ---------- CHECKPOINT ----------
+_ck_conn: Optional[sqlite3.Connection] = None
+
+def get_checkpoint_db() -> sqlite3.Connection:
+    """Open the single-row SQLite checkpoint store (WAL, autocommit) on first use."""
+    global _ck_conn
+    if _ck_conn is None:
+        conn = sqlite3.connect(CHECKPOINT_DB, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ck (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                sheet TEXT, category TEXT, subcategory TEXT, brand TEXT,
+                start INT, page_num INT, ts TEXT
+            )
+        """)
+        _ck_conn = conn
+    return _ck_conn
+
 def load_checkpoint() -> Optional[Dict[str, Any]]:
-    if Path(CHECKPOINT_FILE).exists():
+    try:
+        row = get_checkpoint_db().execute(
+            "SELECT sheet, category, subcategory, brand, start, page_num, ts FROM ck WHERE id = 1"
+        ).fetchone()
+        if row:
+            return dict(zip(("sheet", "category", "subcategory", "brand", "start", "page_num", "timestamp"), row))
+    except Exception:
+        logger.exception("Failed to read checkpoint database; starting fresh.")
+        return None
+    # Pick up a checkpoint left by the old JSON format; the next save moves it to SQLite
+    if Path(LEGACY_CHECKPOINT_FILE).exists():
         try:
-            with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(LEGACY_CHECKPOINT_FILE, "rb") as f:
+                return orjson.loads(f.read())
         except Exception:
             logger.exception("Failed to read checkpoint file; starting fresh.")
     return None
 
-def save_checkpoint(state: Dict[str, Any], log: bool = False):
-    tmp = CHECKPOINT_FILE + ".tmp"
+_last_saved_state: Optional[Dict[str, Any]] = None
+
+def save_checkpoint(state: Dict[str, Any], log: bool = False, force: bool = True):
+    """
+    Persist the checkpoint. With force=False the write is skipped unless the crawl moved
+    to another sheet/subcategory/brand or reached a CHECKPOINT_INTERVAL_PAGES boundary,
+    so a crash re-crawls at most that many pages (duplicates are skipped by the DB).
+    """
+    global _last_saved_state
+    if not force and _last_saved_state is not None:
+        if state == _last_saved_state:
+            return
+        moved = any(state.get(k) != _last_saved_state.get(k) for k in ("sheet", "subcategory", "brand"))
+        if not moved and state.get("page_num", 0) % CHECKPOINT_INTERVAL_PAGES:
+            return
     try:
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(state, f, indent=2)
-        os.replace(tmp, CHECKPOINT_FILE)
+        get_checkpoint_db().execute("""
+            INSERT OR REPLACE INTO ck (id, sheet, category, subcategory, brand, start, page_num, ts)
+            VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+        """, (state.get("sheet"), state.get("category"), state.get("subcategory"), state.get("brand"),
+              state.get("start"), state.get("page_num"), state.get("timestamp")))
+        _last_saved_state = dict(state)
         if log:
             logger.info(f"Checkpoint saved: sheet={state.get('sheet')} | category={state.get('category')} | "
                         f"subcategory={state.get('subcategory')} | brand={state.get('brand')} | start={state.get('start')}")
@@ -68,31 +129,29 @@ def save_checkpoint(state: Dict[str, Any], log: bool = False):
 
 def clear_checkpoint():
     try:
-        if Path(CHECKPOINT_FILE).exists():
-            Path(CHECKPOINT_FILE).unlink()
-            logger.info("Checkpoint cleared.")
+        get_checkpoint_db().execute("DELETE FROM ck WHERE id = 1")
+        if Path(LEGACY_CHECKPOINT_FILE).exists():
+            Path(LEGACY_CHECKPOINT_FILE).unlink()
+        logger.info("Checkpoint cleared.")
     except Exception:
-        logger.exception("Failed to clear checkpoint file.")
+        logger.exception("Failed to clear checkpoint.")
 
 # ---------- EXCEL LOADER ----------
 def load_subcategories_from_excel(file_path: str, sheet_name: str):
     try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        df = pd.read_excel(file_path, sheet_name=sheet_name, engine=EXCEL_ENGINE)
     except Exception:
         logger.exception(f"Failed to read Excel sheet: {sheet_name}")
         raise
     if df.empty:
         raise ValueError(f"Excel sheet '{sheet_name}' is empty!")
-    CATEGORY = str(df.iloc[0]['Category']).strip()
-    subcategories = {}
-    row_mapping = {}
-    for idx, row in df.iterrows():
-        subcategory = str(row['SubCategories']).strip()
-        brand = str(row['Brand']).strip()
-        subcategories.setdefault(subcategory, [])
-        if brand not in subcategories[subcategory]:
-            subcategories[subcategory].append(brand)
-        row_mapping[(subcategory, brand)] = idx + 2
+    CATEGORY = str(df['Category'].iloc[0]).strip()
+    df['SubCategories'] = df['SubCategories'].astype(str).str.strip()
+    df['Brand'] = df['Brand'].astype(str).str.strip()
+    # Unique brands per subcategory, both in sheet order
+    subcategories = df.groupby('SubCategories', sort=False)['Brand'].apply(lambda s: list(dict.fromkeys(s))).to_dict()
+    # Excel row number (1-based, after the header) of the last row for each pair
+    row_mapping = dict(zip(zip(df['SubCategories'], df['Brand']), (df.index + 2).tolist()))
     return CATEGORY, subcategories, row_mapping
 
 # ---------- SERPAPI ----------
@@ -126,6 +185,11 @@ def crawl(sheet_name: str, resume_state: Optional[Dict[str, Any]] = None):
     init_db()
     total_urls_found = 0
     session = requests.Session()
+    # Keep-alive connection pool; urllib3 retries connection errors and 429/5xx with exponential backoff
+    retry = Retry(total=MAX_RETRIES, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=frozenset({"GET"}))
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+    session.mount("https://", adapter)
     log_stats = []
 
     ck = {
@@ -157,126 +221,141 @@ def crawl(sheet_name: str, resume_state: Optional[Dict[str, Any]] = None):
                 start = 0
                 max_start = DEFAULT_MAX_START
 
-                try:
-                    if resume_state:
-                        if subcategory == resume_state.get("subcategory") and brand == resume_state.get("brand"):
-                            start = resume_state.get("start", 0)
-                            page_num = resume_state.get("page_num", 0)
-                            logger.info(f"Resuming brand '{brand}' from page {page_num}, start={start}")
-                        else:
-                            continue
-
-                    ck["subcategory"] = subcategory
-                    ck["brand"] = brand
-                    ck["start"] = start
-                    ck["page_num"] = page_num
+                # Decide on resume skips before borrowing a DB connection
+                if resume_state:
+                    if subcategory == resume_state.get("subcategory") and brand == resume_state.get("brand"):
+                        start = resume_state.get("start", 0)
+                        page_num = resume_state.get("page_num", 0)
+                        logger.info(f"Resuming brand '{brand}' from page {page_num}, start={start}")
+                    else:
+                        continue
 
-                    logger.info(f"\n{'='*100}\nCrawling -> Row: {row_number} | Category: '{CATEGORY}' | "
-                                f"Subcategory: '{subcategory}' | Brand: '{brand}'")
+                with pooled_connection() as conn:
+                    try:
+                        ck["subcategory"] = subcategory
+                        ck["brand"] = brand
+                        ck["start"] = start
+                        ck["page_num"] = page_num
 
-                    time.sleep(random.uniform(*FIRST_SLEEP))
-                    seen_urls = load_saved_urls(CATEGORY, subcategory, brand)
+                        logger.info(f"\n{'='*100}\nCrawling -> Row: {row_number} | Category: '{CATEGORY}' | "
+                                    f"Subcategory: '{subcategory}' | Brand: '{brand}'")
 
-                    query = f'site:catawiki.com/en/l/ "{subcategory.strip()}" "{brand.strip()}" ("Sold" OR "Final bid")'
+                        time.sleep(random.uniform(*FIRST_SLEEP))
 
-                    # First request
-                    try:
-                        first_resp = serpapi_search(session, query, start=0, num=RESULTS_PER_PAGE)
-                        first_resp.raise_for_status()
-                        first_data = first_resp.json()
-                        total_results = first_data.get('search_metadata', {}).get('total_results')
-                        if total_results and int(total_results) > 0:
-                            estimated_pages = ceil(int(total_results) / RESULTS_PER_PAGE)
-                            max_start = (estimated_pages - 1) * RESULTS_PER_PAGE
-                            logger.info(f"Estimated total results: {total_results} | Estimated pages: {estimated_pages} | MAX_START={max_start}")
-                        else:
-                            logger.info(f"Total results estimate: N/A | Using default MAX_START: {DEFAULT_MAX_START}")
-                    except Exception:
-                        logger.warning("First request failed or total_results unavailable. Using default MAX_START.")
+                        query = f'site:catawiki.com/en/l/ "{subcategory}" "{brand}" ("Sold" OR "Final bid")'
 
-                    # Pagination
-                    while start <= max_start:
+                        # First request
                         try:
-                            ck.update({"start": start, "page_num": page_num, "timestamp": datetime.utcnow().isoformat()})
-                            save_checkpoint(ck)  # checkpoint per page
-
-                            time.sleep(random.uniform(*REQUEST_SLEEP))
-                            data = None
-                            for attempt in range(1, MAX_RETRIES + 1):
-                                try:
-                                    resp = serpapi_search(session, query, start=start, num=RESULTS_PER_PAGE)
-                                    resp.raise_for_status()
-                                    data = resp.json()
+                            first_resp = serpapi_search(session, query, start=0, num=RESULTS_PER_PAGE)
+                            first_resp.raise_for_status()
+                            first_data = orjson.loads(first_resp.content)
+                            total_results = first_data.get('search_metadata', {}).get('total_results')
+                            if total_results and int(total_results) > 0:
+                                estimated_pages = ceil(int(total_results) / RESULTS_PER_PAGE)
+                                max_start = (estimated_pages - 1) * RESULTS_PER_PAGE
+                                logger.info(f"Estimated total results: {total_results} | Estimated pages: {estimated_pages} | MAX_START={max_start}")
+                            else:
+                                logger.info(f"Total results estimate: N/A | Using default MAX_START: {DEFAULT_MAX_START}")
+                        except Exception:
+                            logger.warning("First request failed or total_results unavailable. Using default MAX_START.")
+
+                        # Pagination
+                        while start <= max_start:
+                            try:
+                                ck.update({"start": start, "page_num": page_num})
+                                save_checkpoint(ck, force=False)  # checkpoint every CHECKPOINT_INTERVAL_PAGES pages
+
+                                time.sleep(random.uniform(*REQUEST_SLEEP))
+                                data = None
+                                for attempt in range(1, MAX_RETRIES + 1):
+                                    try:
+                                        resp = serpapi_search(session, query, start=start, num=RESULTS_PER_PAGE)
+                                        resp.raise_for_status()
+                                        data = orjson.loads(resp.content)
+                                        break
+                                    except RETRY_BODY_ERRORS as e:
+                                        backoff = (2 ** attempt) + random.random()
+                                        logger.warning("Bad response body (attempt %d/%d) | start=%d: %s. Backing off %.1fs",
+                                                       attempt, MAX_RETRIES, start, e, backoff)
+                                        time.sleep(backoff)
+                                    except requests.RequestException as e:
+                                        # Connection errors and 429/5xx responses were already retried by the session adapter
+                                        logger.error("Skipping start=%d | Request failed: %s", start, e)
+                                        break
+                                else:
+                                    logger.error("Skipping start=%d after %d failed attempts", start, MAX_RETRIES)
+
+                                if data is None:
+                                    consecutive_empty += 1
+                                    start += RESULTS_PER_PAGE
+                                    continue
+
+                                organic = data.get("organic_results", [])
+                                total_results = data.get('search_metadata', {}).get('total_results', 'N/A')
+                                logger.debug("start=%d (page %d) | Organic results: %d | Total results estimate: %s",
+                                             start, page_num + 1, len(organic), total_results)
+
+                                rows = []
+                                for result in organic:
+                                    link = extract_link_from_result(result)
+                                    if "catawiki.com/en/l/" in link:
+                                        clean = link.partition("&")[0]
+                                        rows.append((CATEGORY, subcategory, brand, clean))
+
+                                found_this_page = 0
+                                if rows:
+                                    try:
+                                        found_this_page = save_urls_bulk(conn, rows)
+                                    except Exception:
+                                        logger.exception(f"Failed to save {len(rows)} URLs for brand='{brand}'")
+                                total_urls_found += found_this_page
+                                brand_urls += found_this_page
+
+                                logger.debug("Page %d | Found this page: %d", page_num + 1, found_this_page)
+                                page_num += 1
+
+                                if found_this_page == 0:
+                                    consecutive_empty += 1
+                                    if consecutive_empty >= MAX_CONSECUTIVE_EMPTY:
+                                        logger.info(f"{MAX_CONSECUTIVE_EMPTY} consecutive empty pages. Stopping pagination for brand='{brand}'")
+                                        break
+                                else:
+                                    consecutive_empty = 0
+
+                                if start + RESULTS_PER_PAGE > max_start:
+                                    logger.info(f"Reached MAX_START ({max_start}) for brand='{brand}'. Stopping pagination.")
                                     break
-                                except requests.RequestException as e:
-                                    backoff = (2 ** attempt) + random.random()
-                                    logger.warning(f"Request error (attempt {attempt}/{MAX_RETRIES}) | start={start}: {e}. Backing off {backoff:.1f}s")
-                                    time.sleep(backoff)
-
-                            if data is None:
-                                logger.error(f"Skipping start={start} after {MAX_RETRIES} failed attempts.")
-                                consecutive_empty += 1
+
                                 start += RESULTS_PER_PAGE
-                                continue
-
-                            organic = data.get("organic_results", [])
-                            total_results = data.get('search_metadata', {}).get('total_results', 'N/A')
-                            logger.info(f"start={start} (page {page_num+1}) | Organic results: {len(organic)} | Total results estimate: {total_results}")
-
-                            found_this_page = 0
-                            for result in organic:
-                                link = extract_link_from_result(result)
-                                if "catawiki.com/en/l/" in link:
-                                    clean = link.split("&")[0]
-                                    if clean not in seen_urls:
-                                        seen_urls.add(clean)
-                                        try:
-                                            if save_url(CATEGORY, subcategory, brand, clean):
-                                                total_urls_found += 1
-                                                found_this_page += 1
-                                                brand_urls += 1
-                                        except Exception:
-                                            logger.exception(f"Failed to save URL: {clean}")
-
-                            logger.info(f"Page {page_num+1} | Found this page: {found_this_page}")
-                            page_num += 1
-
-                            if found_this_page == 0:
-                                consecutive_empty += 1
-                                if consecutive_empty >= MAX_CONSECUTIVE_EMPTY:
-                                    logger.info(f"{MAX_CONSECUTIVE_EMPTY} consecutive empty pages. Stopping pagination for brand='{brand}'")
-                                    break
-                            else:
-                                consecutive_empty = 0
-
-                            if start + RESULTS_PER_PAGE > max_start:
-                                logger.info(f"Reached MAX_START ({max_start}) for brand='{brand}'. Stopping pagination.")
-                                break
-
-                            start += RESULTS_PER_PAGE
-
-                        except KeyboardInterrupt:
-                            logger.warning("Interrupted! Saving checkpoint and exiting...")
-                            save_checkpoint(ck, log=True)
-                            raise
-
-                except Exception:
-                    logger.exception(f"Exception processing brand='{brand}'. Continuing with next brand...")
-
-                finally:
-                    log_stats.append({
-                        "Row": row_number,
-                        "Category": CATEGORY,
-                        "Subcategory": subcategory,
-                        "Brand": brand,
-                        "Pages Crawled": page_num,
-                        "Total URLs": brand_urls
-                    })
+
+                            except KeyboardInterrupt:
+                                logger.warning("Interrupted! Saving checkpoint and exiting...")
+                                ck["timestamp"] = datetime.utcnow().isoformat()
+                                save_checkpoint(ck, log=True)
+                                raise
+
+                    except Exception:
+                        logger.exception(f"Exception processing brand='{brand}'. Continuing with next brand...")
+
+                    finally:
+                        log_stats.append({
+                            "Row": row_number,
+                            "Category": CATEGORY,
+                            "Subcategory": subcategory,
+                            "Brand": brand,
+                            "Pages Crawled": page_num,
+                            "Total URLs": brand_urls
+                        })
                     
-                    save_checkpoint(ck)
+                        ck["timestamp"] = datetime.utcnow().isoformat()
+                        save_checkpoint(ck)
+
+                    # Only reached for brands that were crawled, not ones skipped on resume
+                    logger.info("Finished brand '%s' | Pages crawled: %d | New URLs: %d", brand, page_num, brand_urls)
 
     except KeyboardInterrupt:
         logger.warning("Interrupted by user. Saving checkpoint and exiting...")
+        ck["timestamp"] = datetime.utcnow().isoformat()
         save_checkpoint(ck, log=True)
         raise
 
@@ -294,7 +373,7 @@ def crawl(sheet_name: str, resume_state: Optional[Dict[str, Any]] = None):
 if __name__ == "__main__":
     resume = load_checkpoint()
     try:
-        xls = pd.ExcelFile(EXCEL_FILE)
+        xls = pd.ExcelFile(EXCEL_FILE, engine=EXCEL_ENGINE)
     except Exception:
         logger.exception(f"Failed to open Excel workbook: {EXCEL_FILE}")
         raise